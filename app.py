@@ -1,31 +1,53 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, Blueprint, current_app, render_template, request, redirect, url_for, session, flash, jsonify
+import click
+import gzip
 import os
 import sqlite3
+import time
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 import random
 import json
 from werkzeug.utils import secure_filename
 
-app = Flask(__name__)
-app.secret_key = os.urandom(24)
+# Routes and commands live on a blueprint; create_app() builds the actual app
+bp = Blueprint('main', __name__, cli_group=None)
 
 UPLOAD_FOLDER = os.path.join('static', 'images')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'svg'}
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+
+# Bump whenever init_db() gains a new table, column or index
+SCHEMA_VERSION = 3
 
 # Available milk brands
 milk_brands = ["Premium", "Regular", "Toned", "Double-Toned", "Organic"]
 
+# Price per litre used when an order has no explicit price
+default_milk_price = 50
+
+# Customers with no delivery in this many days count as churned
+CHURN_WINDOW_DAYS = 7
+
+# Time of day after which a milkman's orders for the next day are locked
+DEFAULT_CUTOFF_TIME = '21:00'
+
+# How long a worker trusts its cached cutoff times before rereading them
+CUTOFF_CACHE_SECONDS = 30
+
 # Database setup
 def get_db_connection():
-    conn = sqlite3.connect('dairy_dash.db')
+    conn = sqlite3.connect(current_app.config['DATABASE'])
     conn.row_factory = sqlite3.Row
     return conn
 
 def init_db():
     conn = get_db_connection()
     
+    # Schema is already current, nothing to do
+    if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+        conn.close()
+        return False
+    
     # Create users table
     conn.execute('''
     CREATE TABLE IF NOT EXISTS users (
@@ -59,6 +81,12 @@ def init_db():
     except sqlite3.OperationalError:
         pass  # Column already exists
     
+    # Ensure cutoff_time column exists
+    try:
+        conn.execute(f"ALTER TABLE milkmen ADD COLUMN cutoff_time TEXT DEFAULT '{DEFAULT_CUTOFF_TIME}'")
+    except sqlite3.OperationalError:
+        pass  # Column already exists
+    
     # Create orders table
     conn.execute('''
     CREATE TABLE IF NOT EXISTS orders (
@@ -90,15 +118,99 @@ def init_db():
     )
     ''')
     
+    # Index deliveries by date so rollups only touch one day at a time
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_deliveries_date ON deliveries (delivery_date)')
+    
+    # Create analytics rollup tables
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS rollup_brand_daily (
+        rollup_date TEXT,
+        milkman_id TEXT,
+        brand TEXT,
+        litres REAL,
+        revenue REAL,
+        deliveries INTEGER,
+        PRIMARY KEY (rollup_date, milkman_id, brand)
+    )
+    ''')
+    
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS rollup_delivery_daily (
+        rollup_date TEXT,
+        milkman_id TEXT,
+        scheduled INTEGER,
+        delivered INTEGER,
+        PRIMARY KEY (rollup_date, milkman_id)
+    )
+    ''')
+    
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS rollup_customers (
+        customer_phone TEXT PRIMARY KEY,
+        milkman_id TEXT,
+        first_delivery TEXT,
+        last_delivery TEXT
+    )
+    ''')
+    
+    # Dates touched since the last refresh, picked up by the next incremental run
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS rollup_dirty_dates (
+        rollup_date TEXT PRIMARY KEY
+    )
+    ''')
+    
+    # Change log that lets milkmen download only what changed on their route
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS route_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        milkman_id TEXT,
+        kind TEXT,
+        customer_phone TEXT,
+        delivery_date TEXT
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_route_changes_milkman ON route_changes (milkman_id, seq)')
+    
+    # Days whose orders have been frozen at the milkman's cutoff
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS order_locks (
+        milkman_id TEXT,
+        delivery_date TEXT,
+        locked_at TEXT,
+        PRIMARY KEY (milkman_id, delivery_date)
+    )
+    ''')
+    
+    # The route each locked day is delivered from
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS locked_orders (
+        milkman_id TEXT,
+        delivery_date TEXT,
+        customer_phone TEXT,
+        customer_name TEXT,
+        address TEXT,
+        brand TEXT,
+        quantity REAL,
+        notes TEXT,
+        price REAL,
+        PRIMARY KEY (milkman_id, delivery_date, customer_phone)
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_locked_orders_customer ON locked_orders (customer_phone, delivery_date)')
+    
+    conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
     conn.commit()
     conn.close()
+    return True
 
-# Initialize database on startup
-init_db()
-
-# Ensure upload directory exists
-if not os.path.exists(app.config['UPLOAD_FOLDER']):
-    os.makedirs(app.config['UPLOAD_FOLDER'])
+@bp.cli.command('init-db')
+def init_db_command():
+    # Run once per deployment (and after upgrades), not from every worker
+    if init_db():
+        click.echo('Database schema created.')
+    else:
+        click.echo('Database schema is already up to date.')
 
 def generate_milkman_id():
     while True:
@@ -113,11 +225,455 @@ def generate_milkman_id():
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-@app.route('/')
+# Order cutoff scheduling
+class OrderScheduler:
+    # Orders for a day lock at the milkman's cutoff time on the day before.
+    # Whether a day is locked follows from the clock and the cached cutoff
+    # alone, so late edits are rejected without touching the database; the
+    # locked orders themselves are written once per milkman and day.
+    #
+    # Each worker keeps its own cache. Cutoffs and locks written by another
+    # worker are picked up once the cached entry is older than cutoff_ttl
+    # seconds, so a cutoff change reaches every worker within that window.
+    
+    def __init__(self, clock=datetime.now, cutoff_ttl=CUTOFF_CACHE_SECONDS):
+        self.clock = clock
+        self.cutoff_ttl = cutoff_ttl
+        self._cutoffs = {}
+        self._locked = set()
+    
+    def cutoff_for(self, conn, milkman_id):
+        cached = self._cutoffs.get(milkman_id)
+        if cached is None or time.monotonic() - cached[1] >= self.cutoff_ttl:
+            row = conn.execute('SELECT cutoff_time FROM milkmen WHERE milkman_id = ?', (milkman_id,)).fetchone()
+            cutoff = row['cutoff_time'] if row and row['cutoff_time'] else DEFAULT_CUTOFF_TIME
+            # Days other workers have locked stay locked even if the cutoff moved later
+            for lock in conn.execute('''
+                SELECT delivery_date FROM order_locks
+                WHERE milkman_id = ? AND delivery_date >= ?
+            ''', (milkman_id, self.clock().strftime('%Y-%m-%d'))).fetchall():
+                self._locked.add((milkman_id, lock['delivery_date']))
+            cached = (datetime.strptime(cutoff, '%H:%M').time(), time.monotonic())
+            self._cutoffs[milkman_id] = cached
+        return cached[0]
+    
+    def set_cutoff(self, conn, milkman_id, cutoff):
+        cutoff_time = datetime.strptime(cutoff, '%H:%M').time()
+        conn.execute('UPDATE milkmen SET cutoff_time = ? WHERE milkman_id = ?', (cutoff, milkman_id))
+        conn.commit()
+        self._cutoffs[milkman_id] = (cutoff_time, time.monotonic())
+    
+    def lock_deadline(self, conn, milkman_id, delivery_date):
+        day = datetime.strptime(delivery_date, '%Y-%m-%d').date()
+        return datetime.combine(day - timedelta(days=1), self.cutoff_for(conn, milkman_id))
+    
+    def is_locked(self, conn, milkman_id, delivery_date):
+        # Work out the deadline first so a stale cache is refreshed before the lookup
+        deadline = self.lock_deadline(conn, milkman_id, delivery_date)
+        if (milkman_id, delivery_date) in self._locked:
+            return True
+        return self.clock() >= deadline
+    
+    def lock_orders(self, conn, milkman_id, delivery_date):
+        # Freeze every customer's order for the day in a single transaction;
+        # a day another worker already locked is left as it is
+        conn.execute('BEGIN IMMEDIATE')
+        existing = conn.execute('SELECT 1 FROM order_locks WHERE milkman_id = ? AND delivery_date = ?',
+                                (milkman_id, delivery_date)).fetchone()
+        if existing:
+            conn.rollback()
+        else:
+            conn.execute('''
+                INSERT INTO locked_orders (milkman_id, delivery_date, customer_phone, customer_name,
+                                           address, brand, quantity, notes, price)
+                SELECT u.milkman_id, ?, u.phone, u.username, u.address,
+                       COALESCE(o.brand, json_extract(u.preferences, '$.brand')),
+                       COALESCE(o.quantity, json_extract(u.preferences, '$.quantity')),
+                       COALESCE(o.notes, ''),
+                       COALESCE(o.price, ?)
+                FROM users u
+                LEFT JOIN orders o ON o.customer_phone = u.phone AND o.delivery_date = ?
+                WHERE u.milkman_id = ? AND u.role = 'customer' AND NOT EXISTS (
+                    -- Already frozen on the route they left after its cutoff
+                    SELECT 1 FROM locked_orders lo
+                    WHERE lo.customer_phone = u.phone AND lo.delivery_date = ?
+                )
+            ''', (delivery_date, default_milk_price, delivery_date, milkman_id, delivery_date))
+            conn.execute('INSERT INTO order_locks (milkman_id, delivery_date, locked_at) VALUES (?, ?, ?)',
+                         (milkman_id, delivery_date, self.clock().strftime('%Y-%m-%d %H:%M:%S')))
+            conn.execute('INSERT INTO route_changes (milkman_id, kind, delivery_date) VALUES (?, ?, ?)',
+                         (milkman_id, 'lock', delivery_date))
+            conn.commit()
+        self._locked.add((milkman_id, delivery_date))
+        return existing is None
+    
+    def lock_due(self, conn, milkman_id=None):
+        # Lock today and tomorrow if their cutoff has passed, which also
+        # catches up on a cutoff that went by while nothing was running
+        if milkman_id is None:
+            milkman_ids = [row['milkman_id'] for row in conn.execute('SELECT milkman_id FROM milkmen').fetchall()]
+        else:
+            milkman_ids = [milkman_id]
+        today = self.clock().date()
+        locked = []
+        for mid in milkman_ids:
+            for day in (today, today + timedelta(days=1)):
+                delivery_date = day.strftime('%Y-%m-%d')
+                if (mid, delivery_date) in self._locked or not self.is_locked(conn, mid, delivery_date):
+                    continue
+                if self.lock_orders(conn, mid, delivery_date):
+                    locked.append((mid, delivery_date))
+        return locked
+    
+    def locked_route(self, conn, milkman_id, delivery_date):
+        # The frozen orders for a locked day, or None while the day is still
+        # open (or predates the scheduler) and the route has to be built live
+        if delivery_date >= self.clock().strftime('%Y-%m-%d'):
+            self.lock_due(conn, milkman_id)
+        lock = conn.execute('SELECT 1 FROM order_locks WHERE milkman_id = ? AND delivery_date = ?',
+                            (milkman_id, delivery_date)).fetchone()
+        if lock is None:
+            return None
+        return conn.execute('''
+            SELECT * FROM locked_orders
+            WHERE milkman_id = ? AND delivery_date = ?
+            ORDER BY customer_name
+        ''', (milkman_id, delivery_date)).fetchall()
+
+def get_scheduler():
+    return current_app.extensions['order_scheduler']
+
+@bp.cli.command('lock-orders')
+def lock_orders_command():
+    # Run every few minutes from cron so routes lock right at each cutoff
+    conn = get_db_connection()
+    locked = get_scheduler().lock_due(conn)
+    conn.close()
+    for milkman_id, delivery_date in locked:
+        click.echo(f'Locked orders for milkman {milkman_id} on {delivery_date}.')
+    if not locked:
+        click.echo('No orders due for locking.')
+
+# Route change log for milkman sync
+def record_route_change(conn, customer_phone, kind, delivery_date=None):
+    # Logged against the customer's current milkman, so call this before and
+    # after anything that moves a customer between routes
+    conn.execute('''
+        INSERT INTO route_changes (milkman_id, kind, customer_phone, delivery_date)
+        SELECT milkman_id, ?, ?, ? FROM users WHERE phone = ? AND role = 'customer'
+    ''', (kind, customer_phone, delivery_date, customer_phone))
+
+def current_route_cursor(conn):
+    return conn.execute('SELECT COALESCE(MAX(seq), 0) FROM route_changes').fetchone()[0]
+
+def sync_customer_row(customer):
+    preferences = json.loads(customer['preferences']) if customer['preferences'] else {}
+    return [customer['phone'], customer['username'], customer['address'],
+            preferences.get('brand'), preferences.get('quantity')]
+
+def locked_dates(conn, milkman_id, from_date):
+    return {row['delivery_date'] for row in conn.execute('''
+        SELECT delivery_date FROM order_locks
+        WHERE milkman_id = ? AND delivery_date >= ?
+    ''', (milkman_id, from_date)).fetchall()}
+
+def sync_locked_route(conn, milkman_id, delivery_date):
+    # A locked day is sent whole and replaces customers plus orders for that date
+    return [[o['customer_phone'], o['customer_name'], o['address'], o['brand'], o['quantity'], o['notes']]
+            for o in conn.execute('''
+                SELECT * FROM locked_orders
+                WHERE milkman_id = ? AND delivery_date = ?
+                ORDER BY customer_name
+            ''', (milkman_id, delivery_date)).fetchall()]
+
+def route_snapshot(conn, milkman_id, from_date):
+    locked = locked_dates(conn, milkman_id, from_date)
+    customers = conn.execute('''
+        SELECT * FROM users
+        WHERE milkman_id = ? AND role = 'customer'
+    ''', (milkman_id,)).fetchall()
+    orders = [o for o in conn.execute('''
+        SELECT o.* FROM orders o
+        JOIN users u ON u.phone = o.customer_phone
+        WHERE u.milkman_id = ? AND u.role = 'customer' AND o.delivery_date >= ?
+        ORDER BY o.delivery_date
+    ''', (milkman_id, from_date)).fetchall() if o['delivery_date'] not in locked]
+    deliveries = conn.execute('''
+        SELECT d.* FROM deliveries d
+        JOIN users u ON u.phone = d.customer_phone
+        WHERE u.milkman_id = ? AND u.role = 'customer' AND d.delivery_date >= ? AND d.status = 'delivered'
+    ''', (milkman_id, from_date)).fetchall()
+    return {
+        'customers': [sync_customer_row(c) for c in customers],
+        'removed_customers': [],
+        'orders': [[o['customer_phone'], o['delivery_date'], o['brand'], o['quantity'], o['notes']] for o in orders],
+        'cancelled_orders': [],
+        'delivered': [[d['customer_phone'], d['delivery_date']] for d in deliveries],
+        'locked': {date: sync_locked_route(conn, milkman_id, date) for date in sorted(locked)}
+    }
+
+def route_delta(conn, milkman_id, from_date, cursor, new_cursor):
+    changes = conn.execute('''
+        SELECT DISTINCT kind, customer_phone, delivery_date FROM route_changes
+        WHERE milkman_id = ? AND seq > ? AND seq <= ?
+    ''', (milkman_id, cursor, new_cursor)).fetchall()
+    
+    delta = {'customers': [], 'removed_customers': [], 'orders': [], 'cancelled_orders': [], 'delivered': [], 'locked': {}}
+    locked = locked_dates(conn, milkman_id, from_date)
+    customers = {}
+    orders = {}
+    for change in changes:
+        if change['kind'] == 'lock':
+            if change['delivery_date'] in locked:
+                delta['locked'][change['delivery_date']] = sync_locked_route(conn, milkman_id, change['delivery_date'])
+            continue
+        
+        phone = change['customer_phone']
+        if phone not in customers:
+            customers[phone] = conn.execute('SELECT * FROM users WHERE phone = ? AND role = ?',
+                                            (phone, 'customer')).fetchone()
+        customer = customers[phone]
+        on_route = customer is not None and customer['milkman_id'] == milkman_id
+        
+        if change['kind'] == 'customer':
+            if on_route:
+                delta['customers'].append(sync_customer_row(customer))
+                # A customer joining the route brings their upcoming orders along
+                for order in conn.execute('''
+                    SELECT * FROM orders
+                    WHERE customer_phone = ? AND delivery_date >= ?
+                ''', (phone, from_date)).fetchall():
+                    if order['delivery_date'] not in locked:
+                        orders[(phone, order['delivery_date'])] = order
+            else:
+                delta['removed_customers'].append(phone)
+            continue
+        
+        # Orders and deliveries only matter for the days still on the route
+        date = change['delivery_date']
+        if not on_route or date < from_date:
+            continue
+        if change['kind'] == 'order':
+            # Locked days come from the frozen route, not from live orders
+            if date in locked:
+                continue
+            order = conn.execute('''
+                SELECT * FROM orders
+                WHERE customer_phone = ? AND delivery_date = ?
+            ''', (phone, date)).fetchone()
+            if order:
+                orders[(phone, date)] = order
+            else:
+                delta['cancelled_orders'].append([phone, date])
+        elif change['kind'] == 'delivery':
+            delta['delivered'].append([phone, date])
+    
+    delta['orders'] = [[phone, date, order['brand'], order['quantity'], order['notes']]
+                       for (phone, date), order in sorted(orders.items())]
+    return delta
+
+def compact_json_response(payload, status=200):
+    body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    response = current_app.response_class(body, status=status, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    if request.accept_encodings['gzip']:
+        response.set_data(gzip.compress(body))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+# Analytics rollups
+def mark_rollup_dirty(conn, rollup_date):
+    conn.execute('INSERT OR IGNORE INTO rollup_dirty_dates (rollup_date) VALUES (?)', (rollup_date,))
+
+# One locked order per customer and day: should a customer ever sit on two
+# locked routes, the route that locked first wins
+LOCKED_ORDERS_CTE = '''
+    WITH locked AS (
+        SELECT l.* FROM locked_orders l
+        JOIN order_locks k ON k.milkman_id = l.milkman_id AND k.delivery_date = l.delivery_date
+        WHERE l.delivery_date = ? AND NOT EXISTS (
+            SELECT 1 FROM locked_orders l2
+            JOIN order_locks k2 ON k2.milkman_id = l2.milkman_id AND k2.delivery_date = l2.delivery_date
+            WHERE l2.customer_phone = l.customer_phone AND l2.delivery_date = l.delivery_date
+              AND (k2.locked_at, k2.milkman_id) < (k.locked_at, k.milkman_id)
+        )
+    )
+'''
+
+def rollup_day(conn, rollup_date):
+    # Rebuild every rollup row for one day. Locked days are built from the
+    # orders frozen at the cutoff, so later preference changes or route moves
+    # do not rewrite history; only days that were never locked fall back to
+    # the customer's current milkman and default preferences
+    conn.execute('DELETE FROM rollup_brand_daily WHERE rollup_date = ?', (rollup_date,))
+    conn.execute(LOCKED_ORDERS_CTE + '''
+        INSERT INTO rollup_brand_daily (rollup_date, milkman_id, brand, litres, revenue, deliveries)
+        SELECT d.delivery_date, COALESCE(l.milkman_id, u.milkman_id) AS route,
+               COALESCE(l.brand, o.brand, json_extract(u.preferences, '$.brand')) AS order_brand,
+               SUM(COALESCE(l.quantity, o.quantity, json_extract(u.preferences, '$.quantity'))),
+               SUM(COALESCE(l.quantity, o.quantity, json_extract(u.preferences, '$.quantity'))
+                   * COALESCE(l.price, o.price, ?)),
+               COUNT(*)
+        FROM deliveries d
+        JOIN users u ON u.phone = d.customer_phone
+        LEFT JOIN locked l ON l.customer_phone = d.customer_phone
+        LEFT JOIN orders o ON o.customer_phone = d.customer_phone AND o.delivery_date = d.delivery_date
+        WHERE d.delivery_date = ? AND d.status = 'delivered'
+        GROUP BY route, order_brand
+    ''', (rollup_date, default_milk_price, rollup_date))
+    
+    # Scheduled deliveries are the locked route where there is one, otherwise
+    # every linked customer, since each has a standing order
+    conn.execute('DELETE FROM rollup_delivery_daily WHERE rollup_date = ?', (rollup_date,))
+    conn.execute(LOCKED_ORDERS_CTE + '''
+        INSERT INTO rollup_delivery_daily (rollup_date, milkman_id, scheduled, delivered)
+        SELECT ?, route.milkman_id, COUNT(*), COUNT(d.id)
+        FROM (
+            SELECT l.milkman_id, l.customer_phone AS phone
+            FROM locked l
+            UNION ALL
+            SELECT u.milkman_id, u.phone
+            FROM users u
+            WHERE u.role = 'customer' AND NOT EXISTS (
+                SELECT 1 FROM order_locks k
+                WHERE k.milkman_id = u.milkman_id AND k.delivery_date = ?
+            ) AND NOT EXISTS (
+                SELECT 1 FROM locked_orders lo
+                WHERE lo.customer_phone = u.phone AND lo.delivery_date = ?
+            )
+        ) route
+        LEFT JOIN deliveries d ON d.customer_phone = route.phone AND d.delivery_date = ? AND d.status = 'delivered'
+        GROUP BY route.milkman_id
+    ''', (rollup_date, rollup_date, rollup_date, rollup_date, rollup_date))
+    
+    conn.execute(LOCKED_ORDERS_CTE + '''
+        INSERT INTO rollup_customers (customer_phone, milkman_id, first_delivery, last_delivery)
+        SELECT d.customer_phone, COALESCE(l.milkman_id, u.milkman_id), d.delivery_date, d.delivery_date
+        FROM deliveries d
+        JOIN users u ON u.phone = d.customer_phone
+        LEFT JOIN locked l ON l.customer_phone = d.customer_phone
+        WHERE d.delivery_date = ? AND d.status = 'delivered'
+        ON CONFLICT(customer_phone) DO UPDATE SET
+            milkman_id = excluded.milkman_id,
+            first_delivery = MIN(first_delivery, excluded.first_delivery),
+            last_delivery = MAX(last_delivery, excluded.last_delivery)
+    ''', (rollup_date, rollup_date))
+    
+    conn.execute('DELETE FROM rollup_dirty_dates WHERE rollup_date = ?', (rollup_date,))
+
+def refresh_rollups(conn, start_date, end_date):
+    day = start_date
+    while day <= end_date:
+        rollup_day(conn, day.strftime('%Y-%m-%d'))
+        day += timedelta(days=1)
+    conn.commit()
+
+def refresh_dirty_rollups(conn):
+    dirty_dates = conn.execute('SELECT rollup_date FROM rollup_dirty_dates').fetchall()
+    for row in dirty_dates:
+        rollup_day(conn, row['rollup_date'])
+    conn.commit()
+    return len(dirty_dates)
+
+def load_analytics(conn, start_date, end_date):
+    start = start_date.strftime('%Y-%m-%d')
+    end = end_date.strftime('%Y-%m-%d')
+    
+    brand_rows = conn.execute('''
+        SELECT rollup_date, brand, SUM(litres) AS litres, SUM(revenue) AS revenue
+        FROM rollup_brand_daily
+        WHERE rollup_date BETWEEN ? AND ?
+        GROUP BY rollup_date, brand
+        ORDER BY rollup_date
+    ''', (start, end)).fetchall()
+    completion_rows = conn.execute('''
+        SELECT rollup_date, SUM(scheduled) AS scheduled, SUM(delivered) AS delivered
+        FROM rollup_delivery_daily
+        WHERE rollup_date BETWEEN ? AND ?
+        GROUP BY rollup_date
+        ORDER BY rollup_date
+    ''', (start, end)).fetchall()
+    churn_cutoff = (end_date - timedelta(days=CHURN_WINDOW_DAYS)).strftime('%Y-%m-%d')
+    churn_row = conn.execute('''
+        SELECT COUNT(*) AS customers, COALESCE(SUM(last_delivery < ?), 0) AS churned
+        FROM rollup_customers
+        WHERE first_delivery <= ?
+    ''', (churn_cutoff, end)).fetchone()
+    
+    days = {}
+    for row in completion_rows:
+        days[row['rollup_date']] = {
+            'date': row['rollup_date'],
+            'litres': {},
+            'total_litres': 0,
+            'revenue': 0,
+            'scheduled': row['scheduled'],
+            'delivered': row['delivered'],
+            'completion_rate': row['delivered'] / row['scheduled'] if row['scheduled'] else 0
+        }
+    brand_totals = {}
+    for row in brand_rows:
+        day = days.setdefault(row['rollup_date'], {
+            'date': row['rollup_date'],
+            'litres': {},
+            'total_litres': 0,
+            'revenue': 0,
+            'scheduled': 0,
+            'delivered': 0,
+            'completion_rate': 0
+        })
+        day['litres'][row['brand']] = row['litres']
+        day['total_litres'] += row['litres']
+        day['revenue'] += row['revenue']
+        brand_totals[row['brand']] = brand_totals.get(row['brand'], 0) + row['litres']
+    
+    daily = [days[date] for date in sorted(days)]
+    scheduled = sum(day['scheduled'] for day in daily)
+    delivered = sum(day['delivered'] for day in daily)
+    return {
+        'start_date': start,
+        'end_date': end,
+        'daily': daily,
+        'brand_totals': brand_totals,
+        'total_litres': sum(day['total_litres'] for day in daily),
+        'total_revenue': sum(day['revenue'] for day in daily),
+        'completion_rate': delivered / scheduled if scheduled else 0,
+        'customers': churn_row['customers'],
+        'churned_customers': churn_row['churned'],
+        'churn_rate': churn_row['churned'] / churn_row['customers'] if churn_row['customers'] else 0
+    }
+
+def analytics_range():
+    days = request.args.get('days', default=30, type=int)
+    days = max(1, min(days, 366))
+    end_date = datetime.now()
+    return end_date - timedelta(days=days - 1), end_date, days
+
+@bp.cli.command('refresh-rollups')
+@click.option('--date', 'rollup_date', default=None, help='Day to rebuild (YYYY-MM-DD), defaults to yesterday.')
+@click.option('--days', default=1, help='Number of days to rebuild, ending at --date.')
+@click.option('--dirty-only', is_flag=True, help='Only rebuild days touched since the last refresh.')
+def refresh_rollups_command(rollup_date, days, dirty_only):
+    conn = get_db_connection()
+    if dirty_only:
+        count = refresh_dirty_rollups(conn)
+        click.echo(f'Refreshed {count} dirty day(s).')
+    else:
+        if rollup_date:
+            end_date = datetime.strptime(rollup_date, '%Y-%m-%d')
+        else:
+            end_date = datetime.now() - timedelta(days=1)
+        start_date = end_date - timedelta(days=days - 1)
+        refresh_rollups(conn, start_date, end_date)
+        refresh_dirty_rollups(conn)
+        click.echo(f"Refreshed rollups from {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}.")
+    conn.close()
+
+@bp.route('/')
 def home():
     return render_template('index.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -145,11 +701,11 @@ def register():
         conn.close()
         
         flash('Registration successful! Please log in.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
     
     return render_template('register.html')
 
-@app.route('/register_milkman', methods=['GET', 'POST'])
+@bp.route('/register_milkman', methods=['GET', 'POST'])
 def register_milkman():
     if request.method == 'POST':
         name = request.form.get('name')
@@ -181,11 +737,11 @@ def register_milkman():
         session['user'] = phone
         session['role'] = 'milkman'
         flash('Registration successful!', 'success')
-        return redirect(url_for('milkman_dashboard'))
+        return redirect(url_for('.milkman_dashboard'))
     
     return render_template('register_milkman.html')
 
-@app.route('/register_customer', methods=['GET', 'POST'])
+@bp.route('/register_customer', methods=['GET', 'POST'])
 def register_customer():
     if request.method == 'POST':
         name = request.form.get('name')
@@ -216,6 +772,9 @@ def register_customer():
             flash('Invalid Milkman ID', 'error')
             return render_template('register_customer.html')
         
+        # Freeze any day already past its cutoff before the customer joins the route
+        get_scheduler().lock_due(conn, milkman_id)
+        
         # Store customer with default preferences
         default_preferences = json.dumps({"brand": milk_brands[0], "quantity": 1})
         
@@ -223,6 +782,7 @@ def register_customer():
             INSERT INTO users (username, email, phone, password, address, milkman_id, role, preferences) 
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         ''', (name, email, phone, generate_password_hash(password), address, milkman_id, 'customer', default_preferences))
+        record_route_change(conn, phone, 'customer')
         
         conn.commit()
         conn.close()
@@ -230,11 +790,11 @@ def register_customer():
         session['user'] = phone
         session['role'] = 'customer'
         flash('Registration successful!', 'success')
-        return redirect(url_for('customer_dashboard'))
+        return redirect(url_for('.customer_dashboard'))
     
     return render_template('register_customer.html', milk_brands=milk_brands)
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         email = request.form.get('email')
@@ -248,13 +808,13 @@ def login():
             session['user'] = email
             session['role'] = user['role']
             flash('Login successful!', 'success')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('.dashboard'))
         else:
             flash('Invalid credentials', 'error')
     
     return render_template('login.html')
 
-@app.route('/login_milkman', methods=['GET', 'POST'])
+@bp.route('/login_milkman', methods=['GET', 'POST'])
 def login_milkman():
     if request.method == 'POST':
         phone = request.form.get('phone')
@@ -268,13 +828,13 @@ def login_milkman():
             session['user'] = phone
             session['role'] = 'milkman'
             flash('Login successful!', 'success')
-            return redirect(url_for('milkman_dashboard'))
+            return redirect(url_for('.milkman_dashboard'))
         else:
             flash('Invalid credentials', 'error')
     
     return render_template('login_milkman.html')
 
-@app.route('/login_customer', methods=['GET', 'POST'])
+@bp.route('/login_customer', methods=['GET', 'POST'])
 def login_customer():
     if request.method == 'POST':
         phone = request.form.get('phone')
@@ -289,34 +849,52 @@ def login_customer():
             session['user'] = phone
             session['role'] = 'customer'
             flash('Login successful!', 'success')
-            return redirect(url_for('customer_dashboard'))
+            return redirect(url_for('.customer_dashboard'))
         else:
             flash('Invalid credentials', 'error')
     
     return render_template('login_customer.html')
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 def dashboard():
     if 'user' not in session:
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
     
     role = session.get('role', 'admin')
     
     if role == 'milkman':
-        return redirect(url_for('milkman_dashboard'))
+        return redirect(url_for('.milkman_dashboard'))
     elif role == 'customer':
-        return redirect(url_for('customer_dashboard'))
+        return redirect(url_for('.customer_dashboard'))
     
     conn = get_db_connection()
     user = conn.execute('SELECT * FROM users WHERE email = ?', (session['user'],)).fetchone()
+    
+    # Fold in today's changes, then serve everything from the rollup tables
+    refresh_dirty_rollups(conn)
+    start_date, end_date, days = analytics_range()
+    analytics = load_analytics(conn, start_date, end_date)
+    conn.close()
+    
+    return render_template('dashboard.html', user=user, analytics=analytics, days=days)
+
+@bp.route('/dashboard/analytics')
+def dashboard_analytics():
+    if 'user' not in session or session.get('role', 'admin') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    conn = get_db_connection()
+    refresh_dirty_rollups(conn)
+    start_date, end_date, _ = analytics_range()
+    analytics = load_analytics(conn, start_date, end_date)
     conn.close()
     
-    return render_template('dashboard.html', user=user)
+    return jsonify(analytics)
 
-@app.route('/milkman_dashboard', methods=['GET', 'POST'])
+@bp.route('/milkman_dashboard', methods=['GET', 'POST'])
 def milkman_dashboard():
     if 'user' not in session or session.get('role') != 'milkman':
-        return redirect(url_for('login_milkman'))
+        return redirect(url_for('.login_milkman'))
     
     conn = get_db_connection()
     milkman = conn.execute('SELECT * FROM milkmen WHERE phone = ?', (session['user'],)).fetchone()
@@ -326,8 +904,9 @@ def milkman_dashboard():
         file = request.files['upi_qr']
         if file and allowed_file(file.filename):
             filename = secure_filename(f"milkman_{milkman['milkman_id']}_qr.{file.filename.rsplit('.', 1)[1].lower()}")
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
             try:
+                os.makedirs(current_app.config['UPLOAD_FOLDER'], exist_ok=True)
                 file.save(filepath)
                 conn.execute('UPDATE milkmen SET upi_qr = ? WHERE milkman_id = ?', (f'images/{filename}', milkman['milkman_id']))
                 conn.commit()
@@ -338,13 +917,22 @@ def milkman_dashboard():
         else:
             flash('Invalid file type. Please upload an image file.', 'error')
 
+    # Handle cutoff time change
+    if request.method == 'POST' and 'cutoff_time' in request.form:
+        try:
+            get_scheduler().set_cutoff(conn, milkman['milkman_id'], request.form.get('cutoff_time'))
+            flash('Order cutoff time updated.', 'success')
+            milkman = conn.execute('SELECT * FROM milkmen WHERE phone = ?', (session['user'],)).fetchone()
+        except ValueError:
+            flash('Invalid cutoff time.', 'error')
+
     # Get selected date from query string, default to tomorrow
     if request.method == 'POST' and 'selected_date' in request.form:
         selected_date = request.form.get('selected_date')
     else:
         selected_date = request.args.get('selected_date')
     if not selected_date:
-        selected_date = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+        selected_date = (get_scheduler().clock() + timedelta(days=1)).strftime('%Y-%m-%d')
 
     # Get all orders for selected date from all linked customers
     next_day_orders = []
@@ -354,7 +942,20 @@ def milkman_dashboard():
         SELECT * FROM users 
         WHERE milkman_id = ? AND role = 'customer'
     ''', (milkman['milkman_id'],)).fetchall()
-    for customer in customers:
+    
+    # Once the cutoff has passed the route comes from the locked orders
+    locked_orders = get_scheduler().locked_route(conn, milkman['milkman_id'], selected_date)
+    for order in locked_orders or []:
+        next_day_orders.append({
+            'customer_name': order['customer_name'],
+            'address': order['address'],
+            'brand': order['brand'],
+            'quantity': order['quantity'],
+            'notes': order['notes'],
+            'phone': order['customer_phone'],
+            'delivered': order['customer_phone'] in delivered_phones
+        })
+    for customer in customers if locked_orders is None else []:
         preferences = customer['preferences']
         if isinstance(preferences, str):
             preferences = json.loads(preferences)
@@ -391,12 +992,13 @@ def milkman_dashboard():
             'email': customer['email'] if customer['email'] else ''
         })
     conn.close()
-    return render_template('milkman_dashboard.html', milkman=milkman, orders=next_day_orders, customers=customer_list, next_day=selected_date, selected_date=selected_date)
+    return render_template('milkman_dashboard.html', milkman=milkman, orders=next_day_orders, customers=customer_list, next_day=selected_date, selected_date=selected_date,
+                          orders_locked=locked_orders is not None, cutoff_time=milkman['cutoff_time'] or DEFAULT_CUTOFF_TIME)
 
-@app.route('/customer_dashboard')
+@bp.route('/customer_dashboard')
 def customer_dashboard():
     if 'user' not in session or session.get('role') != 'customer':
-        return redirect(url_for('login_customer'))
+        return redirect(url_for('.login_customer'))
     
     conn = get_db_connection()
     customer = conn.execute('SELECT * FROM users WHERE phone = ?', (session['user'],)).fetchone()
@@ -410,10 +1012,10 @@ def customer_dashboard():
     
     return render_template('customer_dashboard.html', customer=customer, milkman_name=milkman_name)
 
-@app.route('/milk_preference', methods=['GET', 'POST'])
+@bp.route('/milk_preference', methods=['GET', 'POST'])
 def milk_preference():
     if 'user' not in session or session.get('role') != 'customer':
-        return redirect(url_for('login_customer'))
+        return redirect(url_for('.login_customer'))
     
     customer_phone = session['user']
     conn = get_db_connection()
@@ -428,11 +1030,26 @@ def milk_preference():
         notes = request.form.get('notes', '')
         price = float(request.form.get('price', 50))  # Default to 50 if not set
         
+        scheduler = get_scheduler()
+        try:
+            locked = scheduler.is_locked(conn, customer['milkman_id'], date)
+        except (TypeError, ValueError):
+            conn.close()
+            flash('Please choose a valid delivery date.', 'error')
+            return redirect(url_for('.milk_preference'))
+        if locked:
+            conn.close()
+            flash(f'Orders for {date} are locked. Changes are accepted until the cutoff on the day before.', 'error')
+            return redirect(url_for('.milk_preference'))
+        
         # Update default preferences if selected
         if request.form.get('update_default') == 'on':
+            # Freeze any day already past its cutoff before the defaults change under it
+            scheduler.lock_due(conn, customer['milkman_id'])
             new_preferences = json.dumps({"brand": brand, "quantity": quantity})
             conn.execute('UPDATE users SET preferences = ? WHERE phone = ?', 
                       (new_preferences, customer_phone))
+            record_route_change(conn, customer_phone, 'customer')
         
         # Save specific order for the date
         try:
@@ -447,9 +1064,11 @@ def milk_preference():
                 WHERE customer_phone = ? AND delivery_date = ?
             ''', (brand, quantity, notes, price, customer_phone, date))
         
+        mark_rollup_dirty(conn, date)
+        record_route_change(conn, customer_phone, 'order', date)
         conn.commit()
         flash('Milk preference updated successfully!', 'success')
-        return redirect(url_for('milk_preference'))
+        return redirect(url_for('.milk_preference'))
     
     # Get all orders for this customer
     customer_orders = {}
@@ -474,10 +1093,10 @@ def milk_preference():
                           milk_brands=milk_brands, 
                           orders=customer_orders)
 
-@app.route('/calendar_view')
+@bp.route('/calendar_view')
 def calendar_view():
     if 'user' not in session or session.get('role') != 'customer':
-        return redirect(url_for('login_customer'))
+        return redirect(url_for('.login_customer'))
     
     customer_phone = session['user']
     conn = get_db_connection()
@@ -488,7 +1107,7 @@ def calendar_view():
     customer['preferences'] = preferences
     
     # Get month and year from query parameters, default to current month/year
-    today = datetime.now()
+    today = get_scheduler().clock()
     month = request.args.get('month', default=today.month, type=int)
     year = request.args.get('year', default=today.year, type=int)
     
@@ -533,11 +1152,11 @@ def calendar_view():
     for day in range(1, num_days + 1):
         date_str = f"{year}-{month:02d}-{day:02d}"
         status = "not_ordered"
-        if date_str in customer_deliveries:
+        if date_str in customer_deliveries and customer_deliveries[date_str]['status'] == 'delivered':
             status = "delivered"
         elif date_str in customer_orders:
-            if datetime.now() > datetime.strptime(date_str, '%Y-%m-%d'):
-                status = "delivered"  # For demo purposes, assume delivered if in the past
+            if date_str < today.strftime('%Y-%m-%d'):
+                status = "missed"
             else:
                 status = "ordered"
         calendar_data.append({
@@ -574,10 +1193,10 @@ def calendar_view():
                           next_month=next_month,
                           next_year=next_year)
 
-@app.route('/update_profile', methods=['GET', 'POST'])
+@bp.route('/update_profile', methods=['GET', 'POST'])
 def update_profile():
     if 'user' not in session or session.get('role') != 'customer':
-        return redirect(url_for('login_customer'))
+        return redirect(url_for('.login_customer'))
     
     customer_phone = session['user']
     conn = get_db_connection()
@@ -593,38 +1212,51 @@ def update_profile():
         if not milkman:
             conn.close()
             flash('Invalid Milkman ID', 'error')
-            return redirect(url_for('update_profile'))
+            return redirect(url_for('.update_profile'))
         
-        # Update customer profile
+        # Freeze any day already past its cutoff on both routes before the customer moves
+        scheduler = get_scheduler()
+        scheduler.lock_due(conn, customer['milkman_id'])
+        scheduler.lock_due(conn, milkman_id)
+        
+        # Update customer profile, logging the change on both the old and the new route
+        record_route_change(conn, customer_phone, 'customer')
         conn.execute('UPDATE users SET address = ?, milkman_id = ? WHERE phone = ?', 
                   (address, milkman_id, customer_phone))
+        record_route_change(conn, customer_phone, 'customer')
         conn.commit()
         
         flash('Profile updated successfully!', 'success')
-        return redirect(url_for('customer_dashboard'))
+        return redirect(url_for('.customer_dashboard'))
     
     conn.close()
     
     return render_template('update_profile.html', customer=customer)
 
-@app.route('/cancel_order/<date>')
+@bp.route('/cancel_order/<date>')
 def cancel_order(date):
     if 'user' not in session or session.get('role') != 'customer':
-        return redirect(url_for('login_customer'))
+        return redirect(url_for('.login_customer'))
     
     customer_phone = session['user']
     
-    # Check if the order is for a future date
-    order_date = datetime.strptime(date, '%Y-%m-%d')
-    cutoff_date = datetime.now().replace(hour=23, minute=59, second=59)
-    if order_date < cutoff_date:
-        flash('Cannot cancel orders for today or past dates', 'error')
-        return redirect(url_for('milk_preference'))
+    # Orders can only be cancelled until the milkman's cutoff on the day before
+    conn = get_db_connection()
+    customer = conn.execute('SELECT * FROM users WHERE phone = ?', (customer_phone,)).fetchone()
+    try:
+        locked = get_scheduler().is_locked(conn, customer['milkman_id'], date)
+    except ValueError:
+        locked = True
+    if locked:
+        conn.close()
+        flash('Cannot cancel orders that are already locked for delivery', 'error')
+        return redirect(url_for('.milk_preference'))
     
     # Remove the order
-    conn = get_db_connection()
     result = conn.execute('DELETE FROM orders WHERE customer_phone = ? AND delivery_date = ?', 
                       (customer_phone, date))
+    mark_rollup_dirty(conn, date)
+    record_route_change(conn, customer_phone, 'order', date)
     conn.commit()
     conn.close()
     
@@ -633,18 +1265,18 @@ def cancel_order(date):
     else:
         flash('Order not found', 'error')
     
-    return redirect(url_for('milk_preference'))
+    return redirect(url_for('.milk_preference'))
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     session.pop('user', None)
     session.pop('role', None)
-    return redirect(url_for('home'))
+    return redirect(url_for('.home'))
 
-@app.route('/payment')
+@bp.route('/payment')
 def payment():
     if 'user' not in session or session.get('role') != 'customer':
-        return redirect(url_for('login_customer'))
+        return redirect(url_for('.login_customer'))
 
     customer_phone = session['user']
     conn = get_db_connection()
@@ -672,15 +1304,15 @@ def payment():
     conn.close()
     return render_template('payment.html', upi_qr=upi_qr, amount_remaining=amount_remaining, milkman=milkman)
 
-@app.route('/mark_delivered', methods=['POST'])
+@bp.route('/mark_delivered', methods=['POST'])
 def mark_delivered():
     if 'user' not in session or session.get('role') != 'milkman':
-        return redirect(url_for('login_milkman'))
+        return redirect(url_for('.login_milkman'))
     customer_phone = request.form.get('customer_phone')
     delivery_date = request.form.get('delivery_date')
     if not customer_phone or not delivery_date:
         flash('Invalid request.', 'error')
-        return redirect(url_for('milkman_dashboard'))
+        return redirect(url_for('.milkman_dashboard'))
     conn = get_db_connection()
     # Insert or update delivery status
     try:
@@ -689,13 +1321,121 @@ def mark_delivered():
             VALUES (?, ?, ?)
             ON CONFLICT(customer_phone, delivery_date) DO UPDATE SET status=excluded.status
         ''', (customer_phone, delivery_date, 'delivered'))
+        mark_rollup_dirty(conn, delivery_date)
+        record_route_change(conn, customer_phone, 'delivery', delivery_date)
         conn.commit()
         flash('Marked as delivered.', 'success')
     except Exception as e:
         flash(f'Error marking as delivered: {e}', 'error')
     finally:
         conn.close()
-    return redirect(url_for('milkman_dashboard'))
+    return redirect(url_for('.milkman_dashboard'))
+
+@bp.route('/milkman_sync', methods=['GET', 'POST'])
+def milkman_sync():
+    if 'user' not in session or session.get('role') != 'milkman':
+        return compact_json_response({'error': 'Unauthorized'}, 401)
+    
+    conn = get_db_connection()
+    milkman = conn.execute('SELECT * FROM milkmen WHERE phone = ?', (session['user'],)).fetchone()
+    
+    # Accept a batch of delivery confirmations collected while offline
+    if request.method == 'POST':
+        data = request.get_data()
+        try:
+            if request.headers.get('Content-Encoding') == 'gzip':
+                data = gzip.decompress(data)
+            confirmations = json.loads(data or b'{}').get('delivered', [])
+        except (OSError, EOFError, ValueError, AttributeError):
+            confirmations = None
+        if not isinstance(confirmations, list):
+            conn.close()
+            return compact_json_response({'error': 'Invalid sync payload'}, 400)
+        
+        route_phones = {row['phone'] for row in conn.execute('''
+            SELECT phone FROM users
+            WHERE milkman_id = ? AND role = 'customer'
+        ''', (milkman['milkman_id'],)).fetchall()}
+        accepted = []
+        rejected = []
+        for item in confirmations:
+            # Each item must be a [phone, date] pair of strings
+            if not (isinstance(item, list) and len(item) == 2
+                    and all(isinstance(value, str) for value in item)):
+                rejected.append(item)
+                continue
+            customer_phone, delivery_date = item
+            try:
+                datetime.strptime(delivery_date, '%Y-%m-%d')
+            except ValueError:
+                rejected.append(item)
+                continue
+            if customer_phone in route_phones:
+                accepted.append((customer_phone, delivery_date))
+            else:
+                rejected.append(item)
+        
+        # A client retrying a batch may repeat items
+        accepted = list(dict.fromkeys(accepted))
+        
+        conn.executemany('''
+            INSERT INTO deliveries (customer_phone, delivery_date, status)
+            VALUES (?, ?, 'delivered')
+            ON CONFLICT(customer_phone, delivery_date) DO UPDATE SET status=excluded.status
+        ''', accepted)
+        for customer_phone, delivery_date in accepted:
+            mark_rollup_dirty(conn, delivery_date)
+            record_route_change(conn, customer_phone, 'delivery', delivery_date)
+        conn.commit()
+        conn.close()
+        return compact_json_response({'accepted': len(accepted), 'rejected': rejected})
+    
+    # Lock any day past its cutoff first so it goes out as the frozen route
+    scheduler = get_scheduler()
+    scheduler.lock_due(conn, milkman['milkman_id'])
+    
+    # Send the whole route for a fresh client, otherwise only what changed since its cursor
+    cursor = request.args.get('cursor', type=int)
+    from_date = scheduler.clock().strftime('%Y-%m-%d')
+    new_cursor = current_route_cursor(conn)
+    if cursor is None or cursor > new_cursor:
+        payload = route_snapshot(conn, milkman['milkman_id'], from_date)
+        payload['full'] = True
+    else:
+        payload = route_delta(conn, milkman['milkman_id'], from_date, cursor, new_cursor)
+        payload['full'] = False
+    payload['cursor'] = new_cursor
+    payload['from_date'] = from_date
+    conn.close()
+    return compact_json_response(payload)
+
+def create_app(test_config=None):
+    app = Flask(__name__)
+    app.config.from_mapping(
+        SECRET_KEY=os.environ.get('DAIRY_DASH_SECRET_KEY'),
+        DATABASE=os.environ.get('DAIRY_DASH_DB', 'dairy_dash.db'),
+        UPLOAD_FOLDER=UPLOAD_FOLDER,
+    )
+    if test_config is not None:
+        app.config.update(test_config)
+    
+    # Workers must share a key to read each other's sessions; the random
+    # fallback is only good for a single development process
+    if not app.config['SECRET_KEY']:
+        if not (app.debug or app.testing):
+            app.logger.warning('DAIRY_DASH_SECRET_KEY is not set; using a random per-process key. '
+                               'Sessions will not survive restarts or be shared between workers.')
+        app.config['SECRET_KEY'] = os.urandom(24)
+    
+    app.extensions['order_scheduler'] = OrderScheduler(
+        clock=app.config.get('CLOCK', datetime.now),
+        cutoff_ttl=app.config.get('CUTOFF_CACHE_SECONDS', CUTOFF_CACHE_SECONDS),
+    )
+    app.register_blueprint(bp)
+    return app
 
 if __name__ == '__main__':
+    app = create_app({'DEBUG': True})
+    with app.app_context():
+        init_db()
     app.run(debug=True)
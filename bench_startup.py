@@ -0,0 +1,36 @@
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Cold worker boot: a fresh interpreter importing app.py and building the app,
+# the same work every forked/spawned worker does before serving a request
+BOOT_SNIPPET = 'import app; app.create_app()'
+RUNS = 20
+
+def time_boot(env):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', BOOT_SNIPPET], check=True, env=env,
+                   cwd=os.path.dirname(os.path.abspath(__file__)))
+    return time.perf_counter() - start
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else RUNS
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DAIRY_DASH_DB=os.path.join(tmp, 'bench.db'))
+        timings = [time_boot(env) for _ in range(runs)]
+        # Interpreter start-up alone, to see how much of the boot is ours
+        interpreter = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', 'import flask'], check=True, env=env)
+            interpreter.append(time.perf_counter() - start)
+    print(f'runs: {runs}')
+    print(f'python + flask import: median {statistics.median(interpreter) * 1000:.1f} ms')
+    print(f'cold worker boot:      median {statistics.median(timings) * 1000:.1f} ms, '
+          f'min {min(timings) * 1000:.1f} ms, max {max(timings) * 1000:.1f} ms')
+
+if __name__ == '__main__':
+    main()
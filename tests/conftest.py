@@ -0,0 +1,49 @@
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as dairy_app
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock(datetime(2026, 10, 19, 20, 0))
+
+
+@pytest.fixture
+def app(tmp_path, clock):
+    app = dairy_app.create_app({
+        'DATABASE': str(tmp_path / 'test.db'),
+        'SECRET_KEY': 'test',
+        'TESTING': True,
+        'CLOCK': clock,
+    })
+    with app.app_context():
+        dairy_app.init_db()
+    return app
+
+
+@pytest.fixture
+def db(app):
+    with app.app_context():
+        conn = dairy_app.get_db_connection()
+    yield conn
+    conn.close()
+
+
+def login(client, user, role):
+    with client.session_transaction() as session:
+        session['user'] = user
+        session['role'] = role
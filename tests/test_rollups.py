@@ -0,0 +1,73 @@
+import json
+from datetime import datetime
+
+import pytest
+
+import app as dairy_app
+
+MILKMAN_ID = '123456'
+DAY = '2026-10-20'
+
+
+@pytest.fixture(autouse=True)
+def locked_day(app, db, clock):
+    # Two customers on one route; the first has an explicit order for the day
+    db.execute('INSERT INTO milkmen (name, phone, password, milkman_id, cutoff_time) VALUES (?, ?, ?, ?, ?)',
+               ('Milkman', '9000000000', 'x', MILKMAN_ID, '21:00'))
+    for phone in ('9000000001', '9000000002'):
+        db.execute('''
+            INSERT INTO users (username, phone, password, address, milkman_id, role, preferences)
+            VALUES (?, ?, 'x', 'Street', ?, 'customer', ?)
+        ''', (phone, phone, MILKMAN_ID, json.dumps({'brand': 'Premium', 'quantity': 1})))
+    db.execute('''
+        INSERT INTO orders (customer_phone, delivery_date, brand, quantity, notes, price)
+        VALUES ('9000000001', ?, 'Toned', 2, '', 60)
+    ''', (DAY,))
+    db.commit()
+
+    clock.now = datetime(2026, 10, 19, 21, 1)
+    with app.app_context():
+        app.extensions['order_scheduler'].lock_orders(db, MILKMAN_ID, DAY)
+
+    db.execute("INSERT INTO deliveries (customer_phone, delivery_date, status) VALUES ('9000000001', ?, 'delivered')",
+               (DAY,))
+    db.commit()
+
+
+def rollup(db):
+    dairy_app.rollup_day(db, DAY)
+    db.commit()
+    brands = db.execute('SELECT * FROM rollup_brand_daily WHERE rollup_date = ?', (DAY,)).fetchall()
+    completion = db.execute('SELECT * FROM rollup_delivery_daily WHERE rollup_date = ?', (DAY,)).fetchall()
+    return ([(r['milkman_id'], r['brand'], r['litres'], r['revenue'], r['deliveries']) for r in brands],
+            [(r['milkman_id'], r['scheduled'], r['delivered']) for r in completion])
+
+
+def test_locked_day_rollup_uses_frozen_orders(db):
+    # Later changes to the live order and preferences do not rewrite the day
+    db.execute("UPDATE orders SET quantity = 9, price = 10 WHERE customer_phone = '9000000001'")
+    db.execute("UPDATE users SET preferences = ? WHERE phone = '9000000001'",
+               (json.dumps({'brand': 'Organic', 'quantity': 5}),))
+    db.commit()
+
+    brands, completion = rollup(db)
+
+    assert brands == [(MILKMAN_ID, 'Toned', 2.0, 120.0, 1)]
+    assert completion == [(MILKMAN_ID, 2, 1)]
+
+
+def test_customer_on_two_locked_routes_is_counted_once(db):
+    # A customer frozen onto a second route that locked later
+    db.execute("INSERT INTO order_locks (milkman_id, delivery_date, locked_at) VALUES ('654321', ?, '2026-10-19 22:01:00')",
+               (DAY,))
+    db.execute('''
+        INSERT INTO locked_orders (milkman_id, delivery_date, customer_phone, customer_name,
+                                   address, brand, quantity, notes, price)
+        VALUES ('654321', ?, '9000000001', 'x', 'Street', 'Premium', 1, '', 50)
+    ''', (DAY,))
+    db.commit()
+
+    brands, completion = rollup(db)
+
+    assert brands == [(MILKMAN_ID, 'Toned', 2.0, 120.0, 1)]
+    assert completion == [(MILKMAN_ID, 2, 1)]
@@ -0,0 +1,120 @@
+import json
+
+import pytest
+
+from conftest import login
+
+MILKMAN_ID = '123456'
+MILKMAN_PHONE = '9000000000'
+CUSTOMERS = [('9000000001', 'Asha'), ('9000000002', 'Ravi')]
+TOMORROW = '2026-10-20'
+
+
+@pytest.fixture(autouse=True)
+def route(db):
+    # One milkman with a 21:00 cutoff and two customers on the default preference
+    db.execute('INSERT INTO milkmen (name, phone, password, milkman_id, cutoff_time) VALUES (?, ?, ?, ?, ?)',
+               ('Milkman', MILKMAN_PHONE, 'x', MILKMAN_ID, '21:00'))
+    for phone, name in CUSTOMERS:
+        db.execute('''
+            INSERT INTO users (username, phone, password, address, milkman_id, role, preferences)
+            VALUES (?, ?, ?, ?, ?, 'customer', ?)
+        ''', (name, phone, 'x', f'{name} Street', MILKMAN_ID, json.dumps({'brand': 'Premium', 'quantity': 1})))
+    db.commit()
+
+
+def order_for(db, phone, date):
+    return db.execute('SELECT * FROM orders WHERE customer_phone = ? AND delivery_date = ?', (phone, date)).fetchone()
+
+
+def place_order(client, quantity, date=TOMORROW):
+    return client.post('/milk_preference', data={'brand': 'Toned', 'quantity': quantity, 'date': date},
+                       follow_redirects=True)
+
+
+def test_edit_before_cutoff_is_accepted(app, db):
+    client = app.test_client()
+    login(client, CUSTOMERS[0][0], 'customer')
+
+    response = place_order(client, '2')
+
+    assert b'Milk preference updated successfully!' in response.data
+    assert order_for(db, CUSTOMERS[0][0], TOMORROW)['quantity'] == 2
+
+
+def test_edit_and_cancel_after_cutoff_are_rejected(app, db, clock):
+    client = app.test_client()
+    login(client, CUSTOMERS[0][0], 'customer')
+    place_order(client, '2')
+
+    clock.now = clock.now.replace(hour=21, minute=1)
+    edit = place_order(client, '5')
+    cancel = client.get(f'/cancel_order/{TOMORROW}', follow_redirects=True)
+
+    assert f'Orders for {TOMORROW} are locked'.encode() in edit.data
+    assert b'Cannot cancel orders that are already locked for delivery' in cancel.data
+    assert order_for(db, CUSTOMERS[0][0], TOMORROW)['quantity'] == 2
+
+
+def test_lock_due_locks_each_day_once(app, db, clock):
+    clock.now = clock.now.replace(hour=21, minute=1)
+    with app.app_context():
+        scheduler = app.extensions['order_scheduler']
+        first = scheduler.lock_due(db, MILKMAN_ID)
+        second = scheduler.lock_due(db, MILKMAN_ID)
+
+    locks = db.execute('SELECT * FROM order_locks WHERE delivery_date = ?', (TOMORROW,)).fetchall()
+    locked = db.execute('SELECT customer_phone FROM locked_orders WHERE delivery_date = ?', (TOMORROW,)).fetchall()
+    assert (MILKMAN_ID, TOMORROW) in first
+    assert second == []
+    assert len(locks) == 1
+    assert sorted(row['customer_phone'] for row in locked) == sorted(phone for phone, _ in CUSTOMERS)
+
+
+def test_milkman_dashboard_reads_locked_orders(app, db, clock):
+    customer = app.test_client()
+    login(customer, CUSTOMERS[0][0], 'customer')
+    place_order(customer, '2')
+
+    clock.now = clock.now.replace(hour=21, minute=1)
+    with app.app_context():
+        app.extensions['order_scheduler'].lock_due(db, MILKMAN_ID)
+
+    # Changes that slip past the lock must not reach the frozen route
+    db.execute('UPDATE orders SET quantity = 9 WHERE customer_phone = ?', (CUSTOMERS[0][0],))
+    db.execute('''
+        INSERT INTO users (username, phone, password, address, milkman_id, role, preferences)
+        VALUES ('Latecomer', '9000000003', 'x', 'Late Street', ?, 'customer', ?)
+    ''', (MILKMAN_ID, json.dumps({'brand': 'Premium', 'quantity': 1})))
+    db.commit()
+
+    milkman = app.test_client()
+    login(milkman, MILKMAN_PHONE, 'milkman')
+    response = milkman.get(f'/milkman_dashboard?selected_date={TOMORROW}')
+    page = response.data.decode().split('Your Customers')[0]
+
+    assert 'Orders for this day are locked' in page
+    assert '<td>2.0</td>' in page
+    assert '<td>9.0</td>' not in page
+    assert 'Late Street' not in page
+
+
+def test_customer_moving_between_cutoffs_is_locked_once(app, db, clock):
+    # A second milkman whose cutoff is an hour later than the first
+    db.execute('INSERT INTO milkmen (name, phone, password, milkman_id, cutoff_time) VALUES (?, ?, ?, ?, ?)',
+               ('Late Milkman', '9100000000', 'x', '654321', '22:00'))
+    db.commit()
+    customer = app.test_client()
+    login(customer, CUSTOMERS[0][0], 'customer')
+
+    clock.now = clock.now.replace(hour=21, minute=30)
+    customer.post('/update_profile', data={'address': 'New Street', 'milkman_id': '654321'})
+    clock.now = clock.now.replace(hour=22, minute=1)
+    with app.app_context():
+        app.extensions['order_scheduler'].lock_due(db, '654321')
+
+    locked = db.execute('SELECT milkman_id FROM locked_orders WHERE customer_phone = ? AND delivery_date = ?',
+                        (CUSTOMERS[0][0], TOMORROW)).fetchall()
+    assert [row['milkman_id'] for row in locked] == [MILKMAN_ID]
+    assert db.execute('SELECT 1 FROM order_locks WHERE milkman_id = ? AND delivery_date = ?',
+                      ('654321', TOMORROW)).fetchone() is not None